@@ -1,5 +1,6 @@
 import streamlit as st
-from app.db import get_supabase, healthcheck_tables
+from app.db import get_supabase, healthcheck_tables, fetch_stores, fetch_store_for_school, known_store_for_school
+from app.transport import DbError, TransientDbError, describe_error
 
 st.set_page_config(page_title="AHS School Health Inventory", layout="wide")
 
@@ -33,7 +34,11 @@ if sb is None:
 st.success("✅ Supabase connection is ready.")
 
 # --- Check tables exist (non-fatal; shows guidance) ---
-missing = healthcheck_tables(sb)
+try:
+    missing = healthcheck_tables(sb)
+except TransientDbError as e:
+    missing = []
+    st.warning(describe_error(e))
 if missing:
     st.warning(
         "Your database tables are not ready yet. The app can load, but pages will show limited data.\n\n"
@@ -52,6 +57,10 @@ if "school_name" not in st.session_state:
     st.session_state.school_name = ""
 if "full_name" not in st.session_state:
     st.session_state.full_name = ""
+if "store_id" not in st.session_state:
+    st.session_state.store_id = None
+if "store_name" not in st.session_state:
+    st.session_state.store_name = ""
 
 left, right = st.columns([1.2, 1])
 
@@ -61,8 +70,16 @@ with left:
     role = st.selectbox("Role", ["Nurse", "Officer"], index=0)
     full_name = st.text_input("Full name (for records)", value=st.session_state.full_name)
     school_name = ""
+    store = None
     if role == "Nurse":
         school_name = st.text_input("School name", value=st.session_state.school_name)
+    else:
+        try:
+            stores = fetch_stores(sb)
+        except DbError as e:
+            stores = []
+            st.error(describe_error(e))
+        store = st.selectbox("Store", stores, format_func=lambda s: s["name"]) if stores else None
 
     pin = st.text_input("PIN (temporary login)", type="password", help="This is a temporary login. We can upgrade to proper auth later.")
     c1, c2 = st.columns(2)
@@ -73,14 +90,37 @@ with left:
                 st.error("Please enter your full name.")
             elif role == "Nurse" and not school_name.strip():
                 st.error("Please enter your school name.")
+            elif role == "Officer" and store is None:
+                st.error("Please select a store. (Add stores to the stores table first.)")
             elif not pin.strip():
                 st.error("Please enter a PIN.")
             else:
-                st.session_state.logged_in = True
-                st.session_state.role = role
-                st.session_state.full_name = full_name.strip()
-                st.session_state.school_name = school_name.strip()
-                st.success("Logged in successfully. Use the left menu to open your portal.")
+                store_id, store_name = (store["id"], store["name"]) if store else (None, "")
+                offline = False
+                if role == "Nurse":
+                    # A nurse's store comes from the school assignment.
+                    try:
+                        store_id = fetch_store_for_school(sb, school_name.strip())
+                        if store_id is None:
+                            st.error("This school is not assigned to a store yet. Please ask the officer to add it.")
+                    except TransientDbError:
+                        # Let the nurse in anyway: requests are queued locally and
+                        # get their store when they sync (see app/outbox.py).
+                        store_id = known_store_for_school(school_name.strip())
+                        offline = True
+                    except DbError as e:
+                        st.error(describe_error(e))
+
+                if store_id is not None or offline:
+                    st.session_state.logged_in = True
+                    st.session_state.role = role
+                    st.session_state.full_name = full_name.strip()
+                    st.session_state.school_name = school_name.strip()
+                    st.session_state.store_id = None if store_id is None else int(store_id)
+                    st.session_state.store_name = store_name
+                    st.success("Logged in successfully. Use the left menu to open your portal.")
+                    if offline:
+                        st.warning("The database is unreachable right now. Requests you submit are saved and sent when it is back.")
 
     with c2:
         if st.button("Logout", use_container_width=True):
@@ -88,6 +128,8 @@ with left:
             st.session_state.role = None
             st.session_state.school_name = ""
             st.session_state.full_name = ""
+            st.session_state.store_id = None
+            st.session_state.store_name = ""
             st.success("Logged out.")
 
     st.markdown("</div>", unsafe_allow_html=True)
@@ -107,7 +149,9 @@ with right:
         - Amend quantities
         - Approve / Mark Received
         - Download PDF for approved requests
-        - Receive stock from main store
+        - Receive stock from main store (medicines by lot & expiry)
+        - Track expiring medicine lots
+        - Transfer stock between stores and assign schools
         """
     )
     st.markdown('<span class="pill">Stock thresholds: < 50 red, 50–200 orange, > 200 green</span>', unsafe_allow_html=True)
@@ -1,11 +1,39 @@
+import os
+
 STOCK_RED_MAX = 49
-STOCK_ORANGE_MIN = 50
-STOCK_ORANGE_MAX = 100
-STOCK_GREEN_MIN = 101
+STOCK_ORANGE_MAX = 200
+
+# Stock level labels, lowest first: out of stock, red, orange, green.
+STOCK_LEVELS = ["Out of stock", "🔴 Low", "🟠 Medium", "🟢 Good"]
 
 STATUS_LABELS = {
-    "PENDING_APPROVAL": "🟡 Pending approval",
-    "APPROVED_NOT_RECEIVED": "🟠 Approved (not received)",
-    "APPROVED_RECEIVED": "🟢 Approved & received",
-    "REJECTED": "🔴 Rejected",
+    "Pending Approval": "🟡 Pending Approval",
+    "Approved - Not Received": "🟠 Approved - Not Received",
+    "Approved & Received": "🟢 Approved & Received",
 }
+
+CATEGORIES = ["Medicine", "Consumables", "Stationery"]
+
+# Write-behind queue for nurse submissions (SQLite file on the app server, next to Home.py).
+OUTBOX_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "outbox.sqlite3")
+OUTBOX_BATCH_SIZE = 20
+OUTBOX_FLUSH_INTERVAL_S = 5.0
+OUTBOX_BACKOFF_BASE_S = 2.0
+OUTBOX_BACKOFF_MAX_S = 300.0
+OUTBOX_SYNCED_RETENTION_DAYS = 1
+
+# Default window for the "Expiring Stock" view.
+EXPIRY_WARNING_DAYS = 90
+
+# Supabase HTTP transport (see app/transport.py).
+HTTP_CONNECT_TIMEOUT_S = 3.0
+HTTP_READ_TIMEOUT_S = 10.0
+HTTP_MAX_CONNECTIONS = 20
+HTTP_MAX_KEEPALIVE = 10
+HTTP_KEEPALIVE_EXPIRY_S = 30.0
+RETRY_ATTEMPTS = 4
+RETRY_BACKOFF_BASE_S = 0.2
+RETRY_BACKOFF_MAX_S = 2.0
+CALL_DEADLINE_S = 15.0
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_RESET_S = 30.0
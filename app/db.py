@@ -1,6 +1,10 @@
+import uuid
 import streamlit as st
 from typing import List, Dict, Optional
-from datetime import datetime
+from datetime import date, datetime, timedelta
+
+from .constants import HTTP_READ_TIMEOUT_S, STATUS_LABELS
+from .transport import DbError, TransientDbError, build_http_client, execute
 
 # ----------------------------
 # REQUIRED SUPABASE TABLES SQL
@@ -8,6 +12,18 @@ from datetime import datetime
 """
 Run this in Supabase → SQL Editor:
 
+create table if not exists stores (
+  id bigserial primary key,
+  name text not null unique,
+  active boolean default true
+);
+
+-- Each school is served by exactly one store
+create table if not exists schools (
+  name text primary key,
+  store_id bigint not null references stores(id)
+);
+
 create table if not exists items (
   id bigserial primary key,
   name text not null,
@@ -17,16 +33,20 @@ create table if not exists items (
 );
 
 create table if not exists inventory (
-  item_id bigint primary key references items(id) on delete cascade,
+  store_id bigint not null references stores(id),
+  item_id bigint not null references items(id) on delete cascade,
   qty integer not null default 0,
-  updated_at timestamptz default now()
+  updated_at timestamptz default now(),
+  primary key (store_id, item_id)
 );
 
 create table if not exists requests (
   id bigserial primary key,
+  store_id bigint not null references stores(id),
   school_name text not null,
   nurse_name text not null,
   status text not null check (status in ('Pending Approval','Approved - Not Received','Approved & Received')) default 'Pending Approval',
+  client_ref text unique,
   created_at timestamptz default now(),
   updated_at timestamptz default now()
 );
@@ -40,9 +60,239 @@ create table if not exists request_lines (
   created_at timestamptz default now()
 );
 
--- Helpful index
-create index if not exists idx_requests_school on requests(school_name);
+-- Helpful index (store first, so each store's reads only touch its own slice)
+create index if not exists idx_schools_store on schools(store_id);
+create index if not exists idx_requests_store_status on requests(store_id, status, created_at desc);
+-- A school's history spans every store it has been assigned to
+create index if not exists idx_requests_school_created on requests(school_name, created_at desc);
 create index if not exists idx_request_lines_req on request_lines(request_id);
+
+create table if not exists inventory_lots (
+  id bigserial primary key,
+  store_id bigint not null references stores(id),
+  item_id bigint not null references items(id) on delete cascade,
+  lot_number text not null,
+  expiry_date date not null,
+  qty integer not null default 0 check (qty >= 0),
+  received_at timestamptz default now(),
+  unique (store_id, item_id, lot_number)
+);
+
+create table if not exists request_line_lots (
+  line_id bigint references request_lines(id) on delete cascade,
+  lot_id bigint references inventory_lots(id),
+  qty integer not null,
+  primary key (line_id, lot_id)
+);
+
+-- Lot lookups: expiry scans and per-item FEFO order within a store (only lots with stock)
+create index if not exists idx_lots_store_expiry on inventory_lots(store_id, expiry_date) where qty > 0;
+create index if not exists idx_lots_store_item_expiry on inventory_lots(store_id, item_id, expiry_date) where qty > 0;
+
+-- Stock that can actually be issued. inventory.qty is the physical on-hand
+-- total; the part not covered by any lot (stock received before lot tracking)
+-- stays issuable, plus the unexpired lots. Expired lots never count.
+create or replace view inventory_available as
+select i.store_id, i.item_id,
+  (greatest(i.qty - coalesce(l.lot_qty, 0), 0) + coalesce(l.unexpired_qty, 0))::integer as qty
+from inventory i
+left join (
+  select store_id, item_id,
+    sum(qty) as lot_qty,
+    sum(qty) filter (where expiry_date >= current_date) as unexpired_qty
+  from inventory_lots
+  group by store_id, item_id
+) l on l.store_id = i.store_id and l.item_id = i.item_id;
+
+-- One line per item per request
+create unique index if not exists uq_request_lines_req_item on request_lines(request_id, item_id);
+
+-- Create many requests (header + lines) atomically in one call.
+-- p_requests: [{client_ref, store_id, school_name, nurse_name, lines: [{item_id, requested_qty}]}]
+-- Safe to retry: a client_ref that already exists is returned as-is and gets no new lines.
+create or replace function create_requests(p_requests jsonb)
+returns table (client_ref text, request_id bigint) language plpgsql as $$
+#variable_conflict use_column
+declare
+  r jsonb;
+  v_id bigint;
+begin
+  for r in select * from jsonb_array_elements(p_requests) loop
+    insert into requests (store_id, school_name, nurse_name, status, client_ref)
+    values ((r->>'store_id')::bigint, r->>'school_name', r->>'nurse_name', 'Pending Approval', r->>'client_ref')
+    on conflict (client_ref) do nothing
+    returning id into v_id;
+
+    if v_id is not null then
+      insert into request_lines (request_id, item_id, requested_qty)
+      select v_id, (l->>'item_id')::bigint, (l->>'requested_qty')::integer
+      from jsonb_array_elements(r->'lines') l;
+    else
+      select id into v_id from requests where requests.client_ref = r->>'client_ref';
+    end if;
+
+    client_ref := r->>'client_ref';
+    request_id := v_id;
+    return next;
+  end loop;
+end $$;
+
+-- Receive a medicine lot (lot row + inventory total) in one call.
+-- Topping up an existing lot with a different expiry date is rejected.
+create or replace function receive_lot(p_store_id bigint, p_item_id bigint, p_lot_number text, p_expiry_date date, p_qty integer)
+returns boolean language plpgsql as $$
+declare
+  v_expiry date;
+begin
+  if p_qty <= 0 then return false; end if;
+
+  select expiry_date into v_expiry from inventory_lots
+  where store_id = p_store_id and item_id = p_item_id and lot_number = p_lot_number;
+  if found and v_expiry <> p_expiry_date then
+    raise exception 'Lot % is recorded with expiry %, not %', p_lot_number, v_expiry, p_expiry_date;
+  end if;
+
+  insert into inventory_lots (store_id, item_id, lot_number, expiry_date, qty)
+  values (p_store_id, p_item_id, p_lot_number, p_expiry_date, p_qty)
+  on conflict (store_id, item_id, lot_number) do update set qty = inventory_lots.qty + excluded.qty;
+
+  insert into inventory (store_id, item_id, qty) values (p_store_id, p_item_id, p_qty)
+  on conflict (store_id, item_id) do update set qty = inventory.qty + excluded.qty, updated_at = now();
+  return true;
+end $$;
+
+-- Mark a request received: deduct approved quantities from the request's
+-- store, issuing from the first-expiring unexpired lots first (FEFO), then
+-- from untracked stock (inventory.qty not covered by lots). Items without
+-- lots only touch the inventory total. If a lot-tracked item is short of
+-- issuable stock, the whole receive is rolled back.
+-- Returns 'RECEIVED', or 'ALREADY_RECEIVED' when nothing was deducted (safe to retry).
+drop function if exists receive_request_fefo(bigint);
+create or replace function receive_request_fefo(p_request_id bigint)
+returns text language plpgsql as $$
+declare
+  v_store bigint;
+  v_status text;
+  v_tracked boolean;
+  v_qty integer;
+  v_lot_qty integer;
+  v_untracked integer;
+  ln record;
+  lot record;
+  remaining integer;
+  take integer;
+begin
+  -- Lock the header so concurrent clicks cannot deduct twice
+  select store_id, status into v_store, v_status from requests where id = p_request_id for update;
+  if not found then raise exception 'Request % not found', p_request_id; end if;
+  if v_status = 'Approved & Received' then return 'ALREADY_RECEIVED'; end if;
+
+  for ln in
+    select id, item_id, coalesce(approved_qty, 0) as qty from request_lines where request_id = p_request_id
+  loop
+    remaining := ln.qty;
+    for lot in
+      select id, qty from inventory_lots
+      where store_id = v_store and item_id = ln.item_id and qty > 0 and expiry_date >= current_date
+      order by expiry_date, id
+      for update
+    loop
+      exit when remaining <= 0;
+      take := least(remaining, lot.qty);
+      update inventory_lots set qty = qty - take where id = lot.id;
+      insert into request_line_lots (line_id, lot_id, qty) values (ln.id, lot.id, take);
+      remaining := remaining - take;
+    end loop;
+
+    v_tracked := exists (select 1 from inventory_lots where store_id = v_store and item_id = ln.item_id);
+    if v_tracked and remaining > 0 then
+      select qty into v_qty from inventory where store_id = v_store and item_id = ln.item_id for update;
+      select coalesce(sum(qty), 0) into v_lot_qty from inventory_lots where store_id = v_store and item_id = ln.item_id;
+      -- inventory.qty still includes what was just taken from lots
+      v_untracked := greatest(coalesce(v_qty, 0) - v_lot_qty - (ln.qty - remaining), 0);
+      if v_untracked < remaining then
+        raise exception 'Not enough unexpired stock for item % (short by %)', ln.item_id, remaining - v_untracked;
+      end if;
+    end if;
+
+    insert into inventory (store_id, item_id, qty) values (v_store, ln.item_id, 0)
+    on conflict (store_id, item_id) do update set qty = greatest(0, inventory.qty - ln.qty), updated_at = now();
+  end loop;
+
+  update requests set status = 'Approved & Received', updated_at = now() where id = p_request_id;
+  return 'RECEIVED';
+end $$;
+
+-- Move stock between stores in one transaction. Lot-tracked stock moves
+-- FEFO with its lot number and expiry, then from untracked stock; expired
+-- lots never move. Returns false if the source is short of issuable stock.
+create or replace function transfer_stock(p_from_store bigint, p_to_store bigint, p_item_id bigint, p_qty integer)
+returns boolean language plpgsql as $$
+declare
+  v_qty integer;
+  v_lot_qty integer;
+  v_unexpired_qty integer;
+  lot record;
+  remaining integer := p_qty;
+  take integer;
+begin
+  if p_qty <= 0 or p_from_store = p_to_store then return false; end if;
+
+  -- Lock both rows in a fixed order so opposite transfers cannot deadlock
+  perform 1 from inventory
+  where item_id = p_item_id and store_id in (p_from_store, p_to_store)
+  order by store_id for update;
+
+  select qty into v_qty from inventory where store_id = p_from_store and item_id = p_item_id;
+  if coalesce(v_qty, 0) < p_qty then return false; end if;
+
+  select coalesce(sum(qty), 0), coalesce(sum(qty) filter (where expiry_date >= current_date), 0)
+    into v_lot_qty, v_unexpired_qty
+  from inventory_lots where store_id = p_from_store and item_id = p_item_id;
+  if greatest(v_qty - v_lot_qty, 0) + v_unexpired_qty < p_qty then return false; end if;
+
+  for lot in
+    select id, lot_number, expiry_date, qty from inventory_lots
+    where store_id = p_from_store and item_id = p_item_id and qty > 0 and expiry_date >= current_date
+    order by expiry_date, id
+    for update
+  loop
+    exit when remaining <= 0;
+    take := least(remaining, lot.qty);
+    update inventory_lots set qty = qty - take where id = lot.id;
+    insert into inventory_lots (store_id, item_id, lot_number, expiry_date, qty)
+    values (p_to_store, p_item_id, lot.lot_number, lot.expiry_date, take)
+    on conflict (store_id, item_id, lot_number) do update set qty = inventory_lots.qty + excluded.qty;
+    remaining := remaining - take;
+  end loop;
+
+  update inventory set qty = qty - p_qty, updated_at = now() where store_id = p_from_store and item_id = p_item_id;
+  insert into inventory (store_id, item_id, qty) values (p_to_store, p_item_id, p_qty)
+  on conflict (store_id, item_id) do update set qty = inventory.qty + excluded.qty, updated_at = now();
+  return true;
+end $$;
+
+-- Upgrading an existing database:
+--   alter table requests add column if not exists client_ref text unique;
+-- From a single-store database, also create `stores` and `schools` above, then
+--   insert into stores (name) values ('Main Store');
+--   insert into schools (name, store_id) select distinct school_name, 1 from requests on conflict do nothing;
+--   alter table inventory add column store_id bigint not null default 1 references stores(id);
+--   alter table inventory drop constraint inventory_pkey, add primary key (store_id, item_id);
+--   alter table requests add column store_id bigint not null default 1 references stores(id);
+--   alter table inventory_lots add column store_id bigint not null default 1 references stores(id);
+--   alter table inventory_lots drop constraint inventory_lots_item_id_lot_number_key,
+--     add constraint inventory_lots_store_id_item_id_lot_number_key unique (store_id, item_id, lot_number);
+--   -- the defaults only backfill existing rows; new rows must name their store
+--   alter table inventory alter column store_id drop default;
+--   alter table requests alter column store_id drop default;
+--   alter table inventory_lots alter column store_id drop default;
+--   drop function if exists receive_lot(bigint, text, date, integer);
+--   -- replaced by the store-first indexes above
+--   drop index if exists idx_requests_school;
+--   drop index if exists idx_lots_expiry;
+--   drop index if exists idx_lots_item_expiry;
+-- and re-run the index and function statements.
 """
 
 # ----------------------------
@@ -53,28 +303,48 @@ def get_supabase():
     """
     Returns a supabase client or None if secrets are missing.
     """
-    try:
-        from supabase import create_client
-    except Exception:
-        return None
-
     url = st.secrets.get("SUPABASE_URL", "").strip()
     key = st.secrets.get("SUPABASE_ANON_KEY", "").strip()
     if not url or not key:
         return None
-    return create_client(url, key)
+    return create_supabase_client(url, key)
+
+
+def create_supabase_client(url: str, key: str):
+    """
+    Returns a supabase client, or None if supabase-py is not installed.
+    All calls share one pooled keep-alive HTTP client (see app/transport.py).
+    """
+    try:
+        from supabase import create_client, ClientOptions
+    except Exception:
+        return None
+
+    http = build_http_client()
+    if http is None:
+        return create_client(url, key)
+    try:
+        options = ClientOptions(httpx_client=http, postgrest_client_timeout=HTTP_READ_TIMEOUT_S)
+    except TypeError:
+        # Older supabase-py without httpx_client: keep its own pool, still bound the timeout.
+        http.close()
+        options = ClientOptions(postgrest_client_timeout=HTTP_READ_TIMEOUT_S)
+    return create_client(url, key, options=options)
 
 
 def healthcheck_tables(sb) -> List[str]:
     """
     Returns list of missing tables (best-effort check).
+    Raises TransientDbError if the backend itself is unreachable.
     """
-    required = ["items", "inventory", "requests", "request_lines"]
+    required = ["stores", "schools", "items", "inventory", "inventory_lots", "requests", "request_lines"]
     missing = []
     for t in required:
         try:
-            sb.table(t).select("*").limit(1).execute()
-        except Exception:
+            execute(sb.table(t).select("*").limit(1))
+        except TransientDbError:
+            raise
+        except DbError:
             missing.append(t)
     return missing
 
@@ -82,29 +352,68 @@ def healthcheck_tables(sb) -> List[str]:
 # ----------------------------
 # DATA HELPERS
 # ----------------------------
-def fetch_items_with_stock(sb, category: Optional[str] = None) -> List[Dict]:
+# Helpers raise DbError / TransientDbError (app/transport.py) instead of
+# returning empty results, so "no rows" and "backend down" stay distinct.
+# Stock and requests are scoped to a store; the item catalog is shared.
+def fetch_stores(sb) -> List[Dict]:
+    return execute(sb.table("stores").select("id,name").eq("active", True).order("name")).data or []
+
+
+# Last store seen per school in this process, so nurses can still log in during an outage.
+_known_school_stores: Dict[str, int] = {}
+
+
+def fetch_store_for_school(sb, school_name: str) -> Optional[int]:
     """
-    Returns items + qty. Only active items.
+    Returns the store serving a school, or None if the school is not assigned yet.
     """
-    try:
-        q = sb.table("items").select("id,name,category,unit,active").eq("active", True)
-        if category:
-            q = q.eq("category", category)
-        items = q.order("name").execute().data or []
-    except Exception:
-        return []
+    data = execute(sb.table("schools").select("store_id").eq("name", school_name).limit(1)).data
+    store_id = int(data[0]["store_id"]) if data else None
+    if store_id is None:
+        _known_school_stores.pop(school_name, None)
+    else:
+        _known_school_stores[school_name] = store_id
+    return store_id
+
+
+def known_store_for_school(school_name: str) -> Optional[int]:
+    """
+    The store fetch_store_for_school last returned for a school (no network call), or None.
+    """
+    return _known_school_stores.get(school_name)
+
+
+def fetch_schools_for_store(sb, store_id: int) -> List[str]:
+    data = execute(sb.table("schools").select("name").eq("store_id", store_id).order("name")).data or []
+    return [r["name"] for r in data]
+
+
+def assign_school_to_store(sb, school_name: str, store_id: int) -> bool:
+    school_name = (school_name or "").strip()
+    if not school_name:
+        return False
+    execute(sb.table("schools").upsert({"name": school_name, "store_id": int(store_id)}, on_conflict="name"))
+    _known_school_stores[school_name] = int(store_id)
+    return True
+
+
+def fetch_items_with_stock(sb, store_id: int, category: Optional[str] = None) -> List[Dict]:
+    """
+    Returns items + qty available in one store (unexpired lots for lot-tracked items). Only active items.
+    """
+    q = sb.table("items").select("id,name,category,unit,active").eq("active", True)
+    if category:
+        q = q.eq("category", category)
+    items = execute(q.order("name")).data or []
 
     # Fetch inventory for all item ids in one go
     ids = [i["id"] for i in items]
     inv_map = {i: 0 for i in ids}
 
     if ids:
-        try:
-            inv = sb.table("inventory").select("item_id,qty").in_("item_id", ids).execute().data or []
-            for row in inv:
-                inv_map[row["item_id"]] = int(row.get("qty") or 0)
-        except Exception:
-            pass
+        inv = execute(sb.table("inventory_available").select("item_id,qty").eq("store_id", store_id).in_("item_id", ids)).data or []
+        for row in inv:
+            inv_map[row["item_id"]] = int(row.get("qty") or 0)
 
     out = []
     for it in items:
@@ -120,186 +429,241 @@ def fetch_items_with_stock(sb, category: Optional[str] = None) -> List[Dict]:
     return out
 
 
-def upsert_inventory_add(sb, item_id: int, add_qty: int) -> bool:
+def upsert_inventory_add(sb, store_id: int, item_id: int, add_qty: int) -> bool:
     """
-    Adds stock to inventory (creates row if missing).
+    Adds stock to a store's inventory (creates row if missing).
     """
     add_qty = int(add_qty)
     if add_qty <= 0:
         return False
 
-    try:
-        current = sb.table("inventory").select("item_id,qty").eq("item_id", item_id).execute().data
-        if current:
-            new_qty = int(current[0]["qty"]) + add_qty
-            sb.table("inventory").update({"qty": new_qty, "updated_at": datetime.utcnow().isoformat()}).eq("item_id", item_id).execute()
-        else:
-            sb.table("inventory").insert({"item_id": item_id, "qty": add_qty}).execute()
-        return True
-    except Exception:
+    current = execute(sb.table("inventory").select("item_id,qty").eq("store_id", store_id).eq("item_id", item_id)).data
+    if current:
+        new_qty = int(current[0]["qty"]) + add_qty
+        execute(
+            sb.table("inventory")
+            .update({"qty": new_qty, "updated_at": datetime.utcnow().isoformat()})
+            .eq("store_id", store_id)
+            .eq("item_id", item_id),
+            idempotent=False,
+        )
+    else:
+        execute(sb.table("inventory").insert({"store_id": store_id, "item_id": item_id, "qty": add_qty}), idempotent=False)
+    return True
+
+
+def transfer_stock(sb, from_store_id: int, to_store_id: int, item_id: int, qty: int) -> bool:
+    """
+    Moves stock between stores atomically (see transfer_stock in the SQL section).
+    Returns False if the source store does not hold enough.
+    """
+    qty = int(qty)
+    if qty <= 0 or int(from_store_id) == int(to_store_id):
         return False
 
+    res = execute(
+        sb.rpc(
+            "transfer_stock",
+            {"p_from_store": int(from_store_id), "p_to_store": int(to_store_id), "p_item_id": int(item_id), "p_qty": qty},
+        ),
+        idempotent=False,
+    )
+    return bool(res.data)
+
 
-def create_request(sb, school_name: str, nurse_name: str, lines: List[Dict]) -> Optional[int]:
+def create_request(sb, store_id: int, school_name: str, nurse_name: str, lines: List[Dict], client_ref: Optional[str] = None) -> Optional[int]:
     """
     lines: [{item_id:int, requested_qty:int}]
+    client_ref: idempotency key; resubmitting the same key never creates a second request.
     """
-    try:
-        header = sb.table("requests").insert(
-            {
-                "school_name": school_name,
-                "nurse_name": nurse_name,
-                "status": "Pending Approval",
-            }
-        ).execute().data
-        if not header:
-            return None
-        req_id = header[0]["id"]
-
-        payload = []
-        for ln in lines:
-            payload.append(
-                {
-                    "request_id": req_id,
-                    "item_id": int(ln["item_id"]),
-                    "requested_qty": int(ln["requested_qty"]),
-                    "approved_qty": None,
-                }
-            )
-        if payload:
-            sb.table("request_lines").insert(payload).execute()
-        return req_id
-    except Exception:
-        return None
+    client_ref = client_ref or uuid.uuid4().hex
+    ids = create_requests_batch(
+        sb,
+        [{"client_ref": client_ref, "store_id": store_id, "school_name": school_name, "nurse_name": nurse_name, "lines": lines}],
+    )
+    return ids.get(client_ref)
+
+
+def create_requests_batch(sb, submissions: List[Dict]) -> Dict[str, int]:
+    """
+    submissions: [{client_ref:str, store_id:int, school_name:str, nurse_name:str, lines:[{item_id, requested_qty}]}]
+    Inserts many requests (header + lines atomically) in one call and returns {client_ref: request_id}.
+    Safe to retry: a client_ref that already exists is returned without touching its lines.
+    """
+    if not submissions:
+        return {}
+
+    payload = [
+        {
+            "client_ref": s["client_ref"],
+            "store_id": int(s["store_id"]),
+            "school_name": s["school_name"],
+            "nurse_name": s["nurse_name"],
+            "lines": [{"item_id": int(ln["item_id"]), "requested_qty": int(ln["requested_qty"])} for ln in s["lines"]],
+        }
+        for s in submissions
+    ]
+    rows = execute(sb.rpc("create_requests", {"p_requests": payload})).data or []
+    return {r["client_ref"]: int(r["request_id"]) for r in rows}
 
 
 def fetch_requests_for_school(sb, school_name: str) -> List[Dict]:
-    try:
-        data = (
+    """
+    A school's full request history, across every store that has served it.
+    """
+    return (
+        execute(
             sb.table("requests")
             .select("id,school_name,nurse_name,status,created_at,updated_at")
             .eq("school_name", school_name)
             .order("created_at", desc=True)
-            .execute()
-            .data
-            or []
-        )
-        return data
-    except Exception:
-        return []
+        ).data
+        or []
+    )
 
 
-def fetch_all_requests(sb, status: Optional[str] = None) -> List[Dict]:
-    try:
-        q = sb.table("requests").select("id,school_name,nurse_name,status,created_at,updated_at").order("created_at", desc=True)
-        if status:
-            q = q.eq("status", status)
-        return q.execute().data or []
-    except Exception:
-        return []
+def fetch_all_requests(sb, store_id: int, status: Optional[str] = None) -> List[Dict]:
+    q = (
+        sb.table("requests")
+        .select("id,school_name,nurse_name,status,created_at,updated_at")
+        .eq("store_id", store_id)
+        .order("created_at", desc=True)
+    )
+    if status:
+        q = q.eq("status", status)
+    return execute(q).data or []
 
 
 def fetch_request_lines(sb, request_id: int) -> List[Dict]:
-    try:
-        # Join: request_lines + items
-        data = (
+    # Join: request_lines + items
+    data = (
+        execute(
             sb.table("request_lines")
             .select("id,request_id,item_id,requested_qty,approved_qty,items(name,unit,category)")
             .eq("request_id", request_id)
-            .execute()
-            .data
-            or []
+        ).data
+        or []
+    )
+    # Normalize
+    out = []
+    for r in data:
+        item = r.get("items") or {}
+        out.append(
+            {
+                "line_id": r["id"],
+                "item_id": r["item_id"],
+                "item_name": item.get("name", ""),
+                "unit": item.get("unit", "") or "",
+                "category": item.get("category", ""),
+                "requested_qty": int(r.get("requested_qty") or 0),
+                "approved_qty": None if r.get("approved_qty") is None else int(r.get("approved_qty")),
+            }
         )
-        # Normalize
-        out = []
-        for r in data:
-            item = r.get("items") or {}
-            out.append(
-                {
-                    "line_id": r["id"],
-                    "item_id": r["item_id"],
-                    "item_name": item.get("name", ""),
-                    "unit": item.get("unit", "") or "",
-                    "category": item.get("category", ""),
-                    "requested_qty": int(r.get("requested_qty") or 0),
-                    "approved_qty": None if r.get("approved_qty") is None else int(r.get("approved_qty")),
-                }
-            )
-        return out
-    except Exception:
-        return []
+    return out
 
 
 def update_approved_quantities(sb, request_id: int, approved_map: Dict[int, int]) -> bool:
     """
     approved_map: {line_id: approved_qty}
+    Returns False (and changes nothing) if the request was already received:
+    re-approving it would let a second receive deduct stock again.
     """
-    try:
-        for line_id, qty in approved_map.items():
-            sb.table("request_lines").update({"approved_qty": int(qty)}).eq("id", int(line_id)).execute()
-
-        sb.table("requests").update({"status": "Approved - Not Received", "updated_at": datetime.utcnow().isoformat()}).eq("id", request_id).execute()
-        return True
-    except Exception:
+    updated = execute(
+        sb.table("requests")
+        .update({"status": "Approved - Not Received", "updated_at": datetime.utcnow().isoformat()})
+        .eq("id", request_id)
+        .neq("status", "Approved & Received")
+    ).data
+    if not updated:
         return False
 
+    for line_id, qty in approved_map.items():
+        execute(sb.table("request_lines").update({"approved_qty": int(qty)}).eq("id", int(line_id)).eq("request_id", request_id))
+    return True
+
+
+# receive_request_fefo results
+RECEIVED = "RECEIVED"
+ALREADY_RECEIVED = "ALREADY_RECEIVED"
+
 
-def mark_request_received(sb, request_id: int) -> bool:
+def mark_request_received(sb, request_id: int) -> str:
     """
-    Deduct approved quantities from inventory and mark received.
+    Deduct approved quantities from the request's store (FEFO across medicine lots) and mark received.
+    Runs server-side in one call (see receive_request_fefo in the SQL section).
+    Returns RECEIVED, or ALREADY_RECEIVED if nothing was deducted by this call
+    (received earlier, or by a retried attempt whose reply was lost).
     """
-    lines = fetch_request_lines(sb, request_id)
-    if not lines:
-        return False
+    # Safe to retry: the function never deducts a received request twice.
+    res = execute(sb.rpc("receive_request_fefo", {"p_request_id": int(request_id)}))
+    return str(res.data)
 
-    # Deduct
-    try:
-        for ln in lines:
-            approved = ln["approved_qty"]
-            if approved is None:
-                approved = 0
-            approved = int(approved)
-
-            # read current
-            cur = sb.table("inventory").select("item_id,qty").eq("item_id", ln["item_id"]).execute().data
-            cur_qty = int(cur[0]["qty"]) if cur else 0
-            new_qty = max(0, cur_qty - approved)
-
-            if cur:
-                sb.table("inventory").update({"qty": new_qty, "updated_at": datetime.utcnow().isoformat()}).eq("item_id", ln["item_id"]).execute()
-            else:
-                sb.table("inventory").insert({"item_id": ln["item_id"], "qty": 0}).execute()
-
-        sb.table("requests").update({"status": "Approved & Received", "updated_at": datetime.utcnow().isoformat()}).eq("id", request_id).execute()
-        return True
-    except Exception:
-        return False
 
+def receive_lot(sb, store_id: int, item_id: int, lot_number: str, expiry_date: date, add_qty: int) -> bool:
+    """
+    Adds a medicine lot (or tops up an existing lot) and the store's inventory total.
+    """
+    add_qty = int(add_qty)
+    lot_number = (lot_number or "").strip()
+    if add_qty <= 0 or not lot_number:
+        return False
 
-# ----------------------------
-# UI HELPERS
-# ----------------------------
-def stock_badge(qty: int) -> str:
+    res = execute(
+        sb.rpc(
+            "receive_lot",
+            {
+                "p_store_id": int(store_id),
+                "p_item_id": int(item_id),
+                "p_lot_number": lot_number,
+                "p_expiry_date": expiry_date.isoformat(),
+                "p_qty": add_qty,
+            },
+        ),
+        idempotent=False,
+    )
+    return bool(res.data)
+
+
+def fetch_expiring_lots(sb, store_id: int, within_days: int) -> List[Dict]:
     """
-    Color rule:
-    - < 50 red
-    - 50–200 orange
-    - > 200 green
+    A store's lots with stock expiring within N days (already expired included), soonest first.
     """
-    qty = int(qty)
-    if qty <= 0:
-        return "Out of stock"
-    if qty < 50:
-        return "🔴 Low"
-    if qty <= 200:
-        return "🟠 Medium"
-    return "🟢 Good"
+    cutoff = (date.today() + timedelta(days=int(within_days))).isoformat()
+    data = (
+        execute(
+            sb.table("inventory_lots")
+            .select("id,item_id,lot_number,expiry_date,qty,items(name,unit,category)")
+            .eq("store_id", store_id)
+            .gt("qty", 0)
+            .lte("expiry_date", cutoff)
+            .order("expiry_date")
+        ).data
+        or []
+    )
+
+    today = date.today()
+    out = []
+    for r in data:
+        item = r.get("items") or {}
+        expiry = date.fromisoformat(r["expiry_date"])
+        out.append(
+            {
+                "lot_id": r["id"],
+                "item_id": r["item_id"],
+                "item_name": item.get("name", ""),
+                "unit": item.get("unit", "") or "",
+                "category": item.get("category", ""),
+                "lot_number": r["lot_number"],
+                "expiry_date": r["expiry_date"],
+                "days_left": (expiry - today).days,
+                "qty": int(r.get("qty") or 0),
+            }
+        )
+    return out
 
 
+# ----------------------------
+# UI HELPERS
+# ----------------------------
 def status_badge(status: str) -> str:
-    m = {
-        "Pending Approval": "🟡 Pending Approval",
-        "Approved - Not Received": "🟠 Approved - Not Received",
-        "Approved & Received": "🟢 Approved & Received",
-    }
-    return m.get(status, status)
+    return STATUS_LABELS.get(status, status)
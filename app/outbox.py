@@ -0,0 +1,254 @@
+import json
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import closing
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from .constants import (
+    OUTBOX_PATH,
+    OUTBOX_BATCH_SIZE,
+    OUTBOX_FLUSH_INTERVAL_S,
+    OUTBOX_BACKOFF_BASE_S,
+    OUTBOX_BACKOFF_MAX_S,
+    OUTBOX_SYNCED_RETENTION_DAYS,
+)
+from .db import create_requests_batch, fetch_store_for_school
+from .transport import DbError, TransientDbError
+
+# ----------------------------
+# LOCAL OUTBOX (write-behind queue)
+# ----------------------------
+# Nurse submissions are written here first (local disk speed on the app
+# server) and pushed to Supabase by a background thread (start_flusher), so a
+# slow backend never blocks page rendering. Each entry carries a client_ref
+# that is stored in requests.client_ref, so a retried flush never duplicates
+# a request. Transient errors back off and retry; permanent ones (schema,
+# permissions, unassigned school) mark the entry FAILED with the error shown.
+
+QUEUED = "QUEUED"
+SYNCED = "SYNCED"
+FAILED = "FAILED"
+
+_SCHEMA = """
+create table if not exists outbox (
+  client_ref text primary key,
+  store_id integer,
+  school_name text not null,
+  nurse_name text not null,
+  lines_json text not null,
+  state text not null default 'QUEUED',
+  remote_id integer,
+  attempts integer not null default 0,
+  next_attempt_at real not null default 0,
+  last_error text,
+  created_at text not null,
+  synced_at text
+);
+create index if not exists idx_outbox_due on outbox(state, next_attempt_at);
+drop index if exists idx_outbox_school;
+create index if not exists idx_outbox_school_state on outbox(school_name, state, created_at);
+"""
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, timeout=10)
+    conn.row_factory = sqlite3.Row
+    conn.execute("pragma journal_mode=wal")
+    conn.execute("pragma synchronous=full")
+    conn.executescript(_SCHEMA)
+    # Older outbox files lack these columns.
+    cols = {r["name"] for r in conn.execute("pragma table_info(outbox)")}
+    if "store_id" not in cols:
+        conn.execute("alter table outbox add column store_id integer")
+    if "last_error" not in cols:
+        conn.execute("alter table outbox add column last_error text")
+    return conn
+
+
+def _backoff(attempts: int) -> float:
+    """
+    Exponential backoff with full jitter, capped at OUTBOX_BACKOFF_MAX_S.
+    """
+    cap = min(OUTBOX_BACKOFF_MAX_S, OUTBOX_BACKOFF_BASE_S * (2 ** attempts))
+    return random.uniform(0, cap)
+
+
+def enqueue_request(store_id: Optional[int], school_name: str, nurse_name: str, lines: List[Dict], path: str = OUTBOX_PATH) -> str:
+    """
+    Durably stores a submission and returns its client_ref.
+    lines: [{item_id:int, requested_qty:int}]
+    store_id may be None (nurse logged in while the database was down); it is resolved at flush time.
+    """
+    client_ref = uuid.uuid4().hex
+    payload = json.dumps([{"item_id": int(ln["item_id"]), "requested_qty": int(ln["requested_qty"])} for ln in lines])
+    with closing(_connect(path)) as conn, conn:
+        conn.execute(
+            "insert into outbox (client_ref, store_id, school_name, nurse_name, lines_json, created_at) values (?, ?, ?, ?, ?, ?)",
+            (client_ref, None if store_id is None else int(store_id), school_name, nurse_name, payload, datetime.utcnow().isoformat()),
+        )
+    _wake.set()
+    return client_ref
+
+
+def flush_outbox(sb, batch_size: int = OUTBOX_BATCH_SIZE, path: str = OUTBOX_PATH) -> int:
+    """
+    Pushes due queued submissions to Supabase in one batch.
+    Returns the number of entries synced. Transient failures are rescheduled with
+    backoff; permanent ones are marked FAILED with last_error.
+    """
+    now = time.time()
+    with closing(_connect(path)) as conn:
+        rows = conn.execute(
+            "select * from outbox where state = ? and next_attempt_at <= ? order by created_at limit ?",
+            (QUEUED, now, int(batch_size)),
+        ).fetchall()
+        if not rows:
+            return 0
+
+        errors = {}
+        ids = {}
+        transient = None
+        try:
+            # Entries queued without a store (before multi-store support, or while
+            # the nurse's store could not be looked up): resolve it now.
+            stores = {}
+            for school in {r["school_name"] for r in rows if r["store_id"] is None}:
+                stores[school] = fetch_store_for_school(sb, school)
+
+            submissions = []
+            for r in rows:
+                store_id = r["store_id"] if r["store_id"] is not None else stores.get(r["school_name"])
+                if store_id is None:
+                    errors[r["client_ref"]] = "School is not assigned to a store."
+                    continue
+                submissions.append(
+                    {
+                        "client_ref": r["client_ref"],
+                        "store_id": int(store_id),
+                        "school_name": r["school_name"],
+                        "nurse_name": r["nurse_name"],
+                        "lines": json.loads(r["lines_json"]),
+                    }
+                )
+
+            try:
+                ids = create_requests_batch(sb, submissions)
+            except TransientDbError:
+                raise
+            except DbError as e:
+                if len(submissions) == 1:
+                    errors[submissions[0]["client_ref"]] = str(e)
+                else:
+                    # The batch is one transaction: find the entries that fail on their own.
+                    ids, transient = _submit_one_by_one(sb, submissions, errors)
+        except TransientDbError as e:
+            transient = str(e)
+        except Exception as e:
+            # Unexpected (e.g. a malformed reply): retry later with backoff, but record it.
+            transient = f"{type(e).__name__}: {e}"
+
+        synced_at = datetime.utcnow().isoformat()
+        cutoff = (datetime.utcnow() - timedelta(days=OUTBOX_SYNCED_RETENTION_DAYS)).isoformat()
+        with conn:
+            # Synced entries are visible in the remote history; age them out locally.
+            conn.execute("delete from outbox where state = ? and synced_at < ?", (SYNCED, cutoff))
+            for r in rows:
+                ref = r["client_ref"]
+                if ref in ids:
+                    conn.execute(
+                        "update outbox set state = ?, remote_id = ?, synced_at = ?, last_error = null where client_ref = ?",
+                        (SYNCED, ids[ref], synced_at, ref),
+                    )
+                elif ref in errors:
+                    conn.execute(
+                        "update outbox set state = ?, last_error = ? where client_ref = ?",
+                        (FAILED, errors[ref], ref),
+                    )
+                else:
+                    attempts = int(r["attempts"]) + 1
+                    conn.execute(
+                        "update outbox set attempts = ?, next_attempt_at = ?, last_error = ? where client_ref = ?",
+                        (attempts, now + _backoff(attempts), transient, ref),
+                    )
+    return len(ids)
+
+
+def _submit_one_by_one(sb, submissions: List[Dict], errors: Dict[str, str]):
+    """
+    Re-submits entries individually after a batch failed permanently.
+    Fills `errors` for entries that fail alone; returns ({client_ref: id}, transient error or None).
+    """
+    ids = {}
+    transient = None
+    for sub in submissions:
+        try:
+            ids.update(create_requests_batch(sb, [sub]))
+        except TransientDbError as e:
+            transient = str(e)
+        except DbError as e:
+            errors[sub["client_ref"]] = str(e)
+        except Exception as e:
+            transient = f"{type(e).__name__}: {e}"
+    return ids, transient
+
+
+def retry_failed(school_name: str, path: str = OUTBOX_PATH) -> int:
+    """
+    Re-queues a school's FAILED entries (e.g. after the schema was upgraded).
+    """
+    with closing(_connect(path)) as conn, conn:
+        cur = conn.execute(
+            "update outbox set state = ?, attempts = 0, next_attempt_at = 0 where state = ? and school_name = ?",
+            (QUEUED, FAILED, school_name),
+        )
+    _wake.set()
+    return cur.rowcount
+
+
+# ----------------------------
+# BACKGROUND FLUSHER
+# ----------------------------
+_wake = threading.Event()
+_flusher: Optional[threading.Thread] = None
+_flusher_lock = threading.Lock()
+
+
+def _flush_loop(sb, path: str) -> None:
+    while True:
+        try:
+            synced = flush_outbox(sb, path=path)
+        except Exception:
+            synced = 0  # keep the thread alive; the next pass retries
+        if synced >= OUTBOX_BATCH_SIZE:
+            continue  # more may be due
+        _wake.wait(OUTBOX_FLUSH_INTERVAL_S)
+        _wake.clear()
+
+
+def start_flusher(sb, path: str = OUTBOX_PATH) -> None:
+    """
+    Starts the per-process flush thread once; later calls are no-ops.
+    """
+    global _flusher
+    with _flusher_lock:
+        if _flusher is not None and _flusher.is_alive():
+            return
+        _flusher = threading.Thread(target=_flush_loop, args=(sb, path), name="outbox-flush", daemon=True)
+        _flusher.start()
+
+
+def fetch_outbox_for_school(school_name: str, path: str = OUTBOX_PATH) -> List[Dict]:
+    """
+    A school's submissions not yet synced (QUEUED or FAILED), newest first.
+    """
+    with closing(_connect(path)) as conn:
+        rows = conn.execute(
+            "select client_ref, nurse_name, state, remote_id, attempts, last_error, created_at, synced_at "
+            "from outbox where school_name = ? and state in (?, ?) order by created_at desc",
+            (school_name, QUEUED, FAILED),
+        ).fetchall()
+    return [dict(r) for r in rows]
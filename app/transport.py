@@ -0,0 +1,195 @@
+import importlib.util
+import random
+import threading
+import time
+from typing import Any, Optional
+
+from .constants import (
+    HTTP_CONNECT_TIMEOUT_S,
+    HTTP_READ_TIMEOUT_S,
+    HTTP_MAX_CONNECTIONS,
+    HTTP_MAX_KEEPALIVE,
+    HTTP_KEEPALIVE_EXPIRY_S,
+    RETRY_ATTEMPTS,
+    RETRY_BACKOFF_BASE_S,
+    RETRY_BACKOFF_MAX_S,
+    CALL_DEADLINE_S,
+    BREAKER_FAILURE_THRESHOLD,
+    BREAKER_RESET_S,
+)
+
+try:
+    import httpx
+except Exception:  # supabase brings httpx; keep the module importable without it
+    httpx = None
+
+
+# ----------------------------
+# ERRORS
+# ----------------------------
+class DbError(Exception):
+    """
+    A database call failed and retrying will not help (bad query, permissions, constraint).
+    """
+
+
+class TransientDbError(DbError):
+    """
+    The backend was slow or unreachable; the same call may succeed later.
+    """
+
+
+class CircuitOpenError(TransientDbError):
+    """
+    Calls are short-circuited because the backend failed repeatedly.
+    """
+
+
+# SQLSTATE classes worth retrying: connection, resources, operator intervention, serialization.
+_TRANSIENT_SQLSTATE = ("08", "40", "53", "57")
+
+
+def is_transient(exc: BaseException) -> bool:
+    if isinstance(exc, TransientDbError):
+        return True
+    if httpx is not None and isinstance(exc, (httpx.TransportError, httpx.TimeoutException)):
+        return True
+    if isinstance(exc, (ConnectionError, TimeoutError)):
+        return True
+
+    # httpx.HTTPStatusError carries the response.
+    status = getattr(getattr(exc, "response", None), "status_code", None)
+    if isinstance(status, int):
+        return status >= 500 or status == 429
+
+    # postgrest APIError: `code` is a SQLSTATE, a PGRST code, or the HTTP status for non-JSON replies.
+    code = str(getattr(exc, "code", "") or "")
+    if code.isdigit() and len(code) == 3:
+        return code.startswith("5") or code == "429"
+    return code[:2] in _TRANSIENT_SQLSTATE and len(code) == 5
+
+
+# ----------------------------
+# CIRCUIT BREAKER
+# ----------------------------
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive calls fail transiently (retries exhausted);
+    after `reset_s` lets one probe call through (half-open) and closes again if it succeeds.
+    """
+
+    def __init__(self, threshold: int = BREAKER_FAILURE_THRESHOLD, reset_s: float = BREAKER_RESET_S):
+        self.threshold = threshold
+        self.reset_s = reset_s
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def before_call(self) -> None:
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if time.monotonic() - self._opened_at < self.reset_s or self._probing:
+                raise CircuitOpenError("Database temporarily unavailable (circuit open).")
+            self._probing = True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
+
+
+_breaker = CircuitBreaker()
+
+
+# Longest a single attempt can take before the HTTP client gives up on it.
+_ATTEMPT_TIMEOUT_S = HTTP_CONNECT_TIMEOUT_S + HTTP_READ_TIMEOUT_S
+
+
+def execute(query: Any, idempotent: bool = True, deadline_s: float = CALL_DEADLINE_S) -> Any:
+    """
+    Runs `query.execute()` through the circuit breaker.
+    Idempotent calls are retried with jittered exponential backoff on transient
+    errors, up to RETRY_ATTEMPTS. A retry is only started if it can time out
+    within `deadline_s`, so a call never runs past the deadline because of retries.
+    Raises TransientDbError / DbError instead of returning empty results.
+    """
+    # Newer postgrest-py retries 503 GETs itself with second-long sleeps; keep retries here only.
+    disable_retry = getattr(query, "retry", None)
+    if callable(disable_retry):
+        query = disable_retry(False) or query
+
+    _breaker.before_call()
+    start = time.monotonic()
+    attempts = RETRY_ATTEMPTS if idempotent else 1
+    for attempt in range(attempts):
+        try:
+            res = query.execute()
+        except Exception as e:
+            if not is_transient(e):
+                # The backend answered; it is up even if the query is wrong.
+                _breaker.record_success()
+                raise DbError(str(e)) from e
+            delay = random.uniform(0, min(RETRY_BACKOFF_MAX_S, RETRY_BACKOFF_BASE_S * (2 ** attempt)))
+            if attempt + 1 >= attempts or time.monotonic() - start + delay + _ATTEMPT_TIMEOUT_S > deadline_s:
+                _breaker.record_failure()
+                raise TransientDbError(str(e) or type(e).__name__) from e
+            time.sleep(delay)
+        else:
+            _breaker.record_success()
+            return res
+
+
+# ----------------------------
+# HTTP CLIENT
+# ----------------------------
+def http2_available() -> bool:
+    return importlib.util.find_spec("h2") is not None
+
+
+def build_http_client():
+    """
+    Shared keep-alive pool for all Supabase calls; HTTP/2 when `h2` is installed.
+    Returns None when httpx is unavailable.
+    """
+    if httpx is None:
+        return None
+    return httpx.Client(
+        http2=http2_available(),
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_S,
+        ),
+        timeout=httpx.Timeout(HTTP_READ_TIMEOUT_S, connect=HTTP_CONNECT_TIMEOUT_S),
+    )
+
+
+def describe_error(exc: BaseException) -> str:
+    """
+    User-facing message for a failed database call.
+    """
+    if isinstance(exc, TransientDbError):
+        return "The database is temporarily unreachable. Please try again in a moment."
+    return f"Database error: {exc}"
+
+
+def describe_write_error(exc: BaseException) -> str:
+    """
+    User-facing message for a failed non-idempotent write (stock add, lot receive, transfer).
+    Such writes run once: after a timeout the change may have reached the database.
+    """
+    if isinstance(exc, CircuitOpenError):
+        return describe_error(exc)  # short-circuited, nothing was sent
+    if isinstance(exc, TransientDbError):
+        return "The database did not confirm the change. It may have been applied — check the stock before retrying."
+    return describe_error(exc)
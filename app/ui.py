@@ -1,36 +1,76 @@
+import numpy as np
 import pandas as pd
 from .constants import (
     STOCK_RED_MAX,
-    STOCK_ORANGE_MIN,
     STOCK_ORANGE_MAX,
-    STOCK_GREEN_MIN,
+    STOCK_LEVELS,
+    STATUS_LABELS,
+    CATEGORIES,
 )
 
-def stock_badge(qty: int) -> str:
-    qty = int(qty)
-    if qty <= STOCK_RED_MAX:
-        return "🔴"
-    if STOCK_ORANGE_MIN <= qty <= STOCK_ORANGE_MAX:
-        return "🟠"
-    if qty >= STOCK_GREEN_MIN:
-        return "🟢"
-    return "⚪️"
-
-def format_stock_table(rows: list[dict]) -> pd.DataFrame:
+# ----------------------------
+# TABLE RENDERING (columnar)
+# ----------------------------
+# Every page builds its tables here. Levels, badges and labels are computed
+# per column (pd.cut / categorical renames / string concatenation), never
+# per row, so a rerun stays cheap for catalogs of tens of thousands of items.
+
+# Right-closed bins: <=0 out of stock, 1–49 red, 50–200 orange, >200 green.
+_STOCK_BINS = [-np.inf, 0, STOCK_RED_MAX, STOCK_ORANGE_MAX, np.inf]
+_ITEM_COLUMNS = ["id", "name", "category", "unit", "qty"]
+
+
+def stock_levels(qty: pd.Series) -> pd.Series:
+    return pd.cut(qty, bins=_STOCK_BINS, labels=STOCK_LEVELS)
+
+
+def stock_table(rows: list[dict]) -> pd.DataFrame:
+    """
+    rows from fetch_items_with_stock -> DataFrame with a categorical "Stock Status".
+    """
+    df = pd.DataFrame(rows, columns=_ITEM_COLUMNS)
+    df["qty"] = df["qty"].fillna(0).astype("int64")
+    df["unit"] = df["unit"].fillna("").astype(str)
+    df["category"] = pd.Categorical(df["category"], categories=CATEGORIES)
+    df["Stock Status"] = stock_levels(df["qty"])
+    return df
+
+
+def option_labels(df: pd.DataFrame, caption: str) -> dict[str, int]:
+    """
+    {"<name> (<caption>: <qty> <unit>)": item_id} for select boxes.
+    """
+    labels = df["name"].astype(str) + f" ({caption}: " + df["qty"].astype(str) + " " + df["unit"] + ")"
+    return dict(zip(labels.tolist(), df["id"].astype("int64").tolist()))
+
+
+def requests_table(rows: list[dict]) -> pd.DataFrame:
+    """
+    rows from fetch_*_requests -> DataFrame with categorical "Status" badges and formatted dates.
+    """
     df = pd.DataFrame(rows)
-    if df.empty:
-        return df
-
-    df["Level"] = df["on_hand"].apply(stock_badge)
-    df["Availability"] = df["on_hand"].apply(lambda x: "Out of stock" if int(x) == 0 else "Available")
-
-    df = df[["Level", "category", "item_name", "unit", "on_hand", "Availability"]]
-    df = df.rename(
-        columns={
-            "category": "Category",
-            "item_name": "Item",
-            "unit": "Unit",
-            "on_hand": "On hand",
-        }
-    )
+    known = list(STATUS_LABELS)
+    extra = sorted(set(df["status"].dropna()) - set(known))
+    status = pd.Categorical(df["status"], categories=known + extra)
+    df["Status"] = status.rename_categories(STATUS_LABELS)
+    for src, col in (("created_at", "Created"), ("updated_at", "Updated")):
+        if src in df:
+            df[col] = format_timestamps(df[src])
     return df
+
+
+def format_timestamps(values: pd.Series) -> pd.Series:
+    """
+    ISO timestamps -> "YYYY-MM-DD HH:MM" (UTC), formatted by NumPy instead of per-row strftime.
+    """
+    ts = pd.to_datetime(values, utc=True, format="ISO8601").dt.tz_localize(None)
+    out = np.datetime_as_string(ts.to_numpy().astype("datetime64[m]"), unit="m")
+    out = np.char.replace(out, "T", " ")
+    return pd.Series(np.where(ts.isna(), "", out), index=values.index)
+
+
+def expiry_labels(days_left: pd.Series) -> pd.Series:
+    return pd.Series(
+        np.where(days_left < 0, "⛔ Expired", days_left.astype(str) + " days"),
+        index=days_left.index,
+    )
@@ -1,6 +1,11 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
-from app.db import get_supabase, fetch_items_with_stock, create_request, fetch_requests_for_school, stock_badge, status_badge
+from app.db import get_supabase, fetch_items_with_stock, fetch_requests_for_school, fetch_store_for_school
+from app.ui import stock_table, option_labels, requests_table, format_timestamps
+from app.constants import CATEGORIES
+from app.transport import DbError, describe_error
+from app.outbox import enqueue_request, start_flusher, retry_failed, fetch_outbox_for_school, FAILED
 
 st.set_page_config(page_title="Nurse Portal", layout="wide")
 
@@ -16,22 +21,73 @@ if sb is None:
 
 school_name = st.session_state.get("school_name", "").strip()
 nurse_name = st.session_state.get("full_name", "").strip()
+store_id = st.session_state.get("store_id")
+if store_id is None:
+    # Logged in while the database was down: look the store up once it is back.
+    try:
+        store_id = fetch_store_for_school(sb, school_name)
+    except DbError:
+        store_id = None
+    st.session_state.store_id = store_id
 
 st.title("Nurse Portal")
 st.caption(f"School: **{school_name}**  |  Nurse: **{nurse_name}**")
 
+# Queued submissions are pushed by a background thread, never on the render path.
+start_flusher(sb)
+
 tab1, tab2 = st.tabs(["📦 Available Stock", "🧾 My Requests History"])
 
-with tab1:
-    st.subheader("Available Items (from Officer Inventory)")
-    category = st.selectbox("Category", ["Medicine", "Consumables", "Stationery"], index=0)
 
-    items = fetch_items_with_stock(sb, category=category)
-    if not items:
-        st.info("No items found. (Check database tables and items list.)")
+def submit_request(item_options: dict, select_key: str) -> None:
+    """
+    Button callback: runs before the rerun, reads the form from session state and
+    writes it to the local outbox. No network I/O, so it works during outages.
+    """
+    lines = []
+    for label in st.session_state.get(select_key, []):
+        item_id = item_options.get(label)
+        if item_id is not None:
+            lines.append({"item_id": item_id, "requested_qty": int(st.session_state.get(f"req_qty_{item_id}", 1))})
+    if not lines:
+        return
+    try:
+        st.session_state.submitted_ref = enqueue_request(store_id=store_id, school_name=school_name, nurse_name=nurse_name, lines=lines)
+        st.session_state[select_key] = []
+    except Exception:
+        st.session_state.submit_failed = True
+
+
+with tab1:
+    st.subheader("Available Items (from your school's store)")
+    category = st.selectbox("Category", CATEGORIES, index=0)
+
+    submitted_ref = st.session_state.pop("submitted_ref", None)
+    submit_failed = st.session_state.pop("submit_failed", False)
+
+    # Last good list per store/category: used on the submit rerun (no fetch)
+    # and whenever the backend is unreachable.
+    cache_key = f"items_{store_id}_{category}"
+    if store_id is None:
+        items = None
+        st.warning("Your school's store could not be looked up yet, so stock cannot be shown. Please try again shortly.")
+    elif (submitted_ref or submit_failed) and cache_key in st.session_state:
+        items = st.session_state[cache_key]
     else:
-        df = pd.DataFrame(items)
-        df["Stock Status"] = df["qty"].apply(stock_badge)
+        try:
+            items = fetch_items_with_stock(sb, store_id, category=category)
+            st.session_state[cache_key] = items
+        except DbError as e:
+            items = st.session_state.get(cache_key)
+            if items is None:
+                st.error(describe_error(e))
+            else:
+                st.warning("The database is unreachable, showing the last loaded stock. Requests are still saved and sent later.")
+
+    if items is not None and not items:
+        st.info("No items found. (Check database tables and items list.)")
+    elif items:
+        df = stock_table(items)
 
         # Show only available items (qty > 0) for selection, but display all with out-of-stock label.
         st.markdown("**Stock Overview**")
@@ -48,38 +104,76 @@ with tab1:
         if available_df.empty:
             st.warning("All items in this category are out of stock. You cannot submit a request now.")
         else:
-            item_options = {f"{r['name']} (Available: {int(r['qty'])} {r['unit']})": int(r["id"]) for _, r in available_df.iterrows()}
-            selected = st.multiselect("Select items to request", list(item_options.keys()))
+            item_options = option_labels(available_df, "Available")
+            available_qty = dict(zip(available_df["id"].tolist(), available_df["qty"].tolist()))
+            select_key = f"req_select_{category}"
+            selected = st.multiselect("Select items to request", list(item_options.keys()), key=select_key)
 
-            lines = []
             for label in selected:
                 item_id = item_options[label]
-                max_qty = int(available_df[available_df["id"] == item_id]["qty"].iloc[0])
-                req_qty = st.number_input(f"Requested quantity for: {label}", min_value=1, max_value=max_qty, value=min(1, max_qty), step=1)
-                lines.append({"item_id": item_id, "requested_qty": int(req_qty)})
-
-            if st.button("Submit Request", type="primary", use_container_width=True, disabled=(len(lines) == 0)):
-                req_id = create_request(sb, school_name=school_name, nurse_name=nurse_name, lines=lines)
-                if req_id:
-                    st.success(f"✅ Request submitted successfully. Request ID: {req_id}")
-                else:
-                    st.error("Request failed. Please check database tables and try again.")
+                max_qty = int(available_qty[item_id])
+                st.number_input(
+                    f"Requested quantity for: {label}",
+                    min_value=1,
+                    max_value=max_qty,
+                    value=min(1, max_qty),
+                    step=1,
+                    key=f"req_qty_{item_id}",
+                )
+
+            st.button(
+                "Submit Request",
+                type="primary",
+                use_container_width=True,
+                disabled=(len(selected) == 0),
+                on_click=submit_request,
+                args=(item_options, select_key),
+            )
+
+    if submitted_ref:
+        st.success(f"✅ Request saved (ref {submitted_ref[:8]}). It will sync to the officer automatically.")
+    elif submit_failed:
+        st.error("Request could not be saved. Please try again.")
 
 with tab2:
     st.subheader("My Requests History")
-    reqs = fetch_requests_for_school(sb, school_name)
-    if not reqs:
+    try:
+        reqs = fetch_requests_for_school(sb, school_name)
+    except DbError as e:
+        # Queued submissions are local, so still show them.
+        reqs = []
+        st.error(describe_error(e))
+    queued = fetch_outbox_for_school(school_name)
+    if not reqs and not queued:
         st.info("No requests yet.")
     else:
-        df = pd.DataFrame(reqs)
-        df["Status"] = df["status"].apply(status_badge)
-        df["Created"] = pd.to_datetime(df["created_at"]).dt.strftime("%Y-%m-%d %H:%M")
-        df["Updated"] = pd.to_datetime(df["updated_at"]).dt.strftime("%Y-%m-%d %H:%M")
-
-        st.dataframe(
-            df[["id", "nurse_name", "Status", "Created", "Updated"]],
-            use_container_width=True,
-            hide_index=True,
-        )
-
-        st.caption("Status colors: 🟡 Pending | 🟠 Approved not received | 🟢 Received")
+        if queued:
+            qdf = pd.DataFrame(queued)
+            qdf["Ref"] = qdf["client_ref"].str[:8]
+            qdf["Created"] = format_timestamps(qdf["created_at"])
+            qdf["Sync"] = np.where(qdf["state"] == FAILED, "⛔ Failed", "⏳ Queued")
+            qdf["Error"] = qdf["last_error"].fillna("")
+            st.markdown(f"**Waiting to sync ({len(qdf)})**")
+            st.dataframe(
+                qdf[["Ref", "nurse_name", "Sync", "attempts", "Error", "Created"]],
+                use_container_width=True,
+                hide_index=True,
+            )
+
+            if (qdf["state"] == FAILED).any():
+                st.error("Some requests could not be sent to the officer. Please contact the officer, then retry.")
+                if st.button("Retry failed requests"):
+                    retry_failed(school_name)
+                    st.rerun()
+
+        if reqs:
+            df = requests_table(reqs)
+            df["Sync"] = "✅ Synced"
+
+            st.dataframe(
+                df[["id", "nurse_name", "Status", "Sync", "Created", "Updated"]],
+                use_container_width=True,
+                hide_index=True,
+            )
+
+        st.caption("Status colors: 🟡 Pending | 🟠 Approved not received | 🟢 Received  |  ⏳ Queued = saved on the app server, not yet sent to the officer")
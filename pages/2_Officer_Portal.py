@@ -1,5 +1,6 @@
 import streamlit as st
 import pandas as pd
+from datetime import date
 from fpdf import FPDF
 
 from app.db import (
@@ -10,8 +11,18 @@ from app.db import (
     fetch_request_lines,
     update_approved_quantities,
     mark_request_received,
+    RECEIVED,
+    receive_lot,
+    fetch_expiring_lots,
+    fetch_stores,
+    fetch_schools_for_store,
+    assign_school_to_store,
+    transfer_stock,
     status_badge,
 )
+from app.ui import stock_table, option_labels, requests_table, expiry_labels
+from app.constants import EXPIRY_WARNING_DAYS, CATEGORIES
+from app.transport import DbError, describe_error, describe_write_error
 
 st.set_page_config(page_title="Officer Portal", layout="wide")
 
@@ -26,11 +37,18 @@ if sb is None:
     st.stop()
 
 officer_name = st.session_state.get("full_name", "").strip()
+store_id = st.session_state.get("store_id")
+store_name = st.session_state.get("store_name", "")
+if store_id is None:
+    st.warning("Please login again from Home (no store selected).")
+    st.stop()
 
 st.title("Officer Portal")
-st.caption(f"Officer: **{officer_name}**")
+st.caption(f"Officer: **{officer_name}**  |  Store: **{store_name}**")
 
-tab1, tab2, tab3 = st.tabs(["🧾 Requests Review", "📥 Receive Stock", "📊 Inventory Overview"])
+tab1, tab2, tab3, tab4, tab5 = st.tabs(
+    ["🧾 Requests Review", "📥 Receive Stock", "📊 Inventory Overview", "⏳ Expiring Stock", "🏬 Stores & Transfers"]
+)
 
 
 def build_pdf_bytes(request_row: dict, lines_df: pd.DataFrame) -> bytes:
@@ -77,15 +95,18 @@ with tab1:
     )
     status_val = None if status_filter == "All" else status_filter
 
-    reqs = fetch_all_requests(sb, status=status_val)
-    if not reqs:
+    try:
+        reqs = fetch_all_requests(sb, store_id, status=status_val)
+    except DbError as e:
+        reqs = None
+        st.error(describe_error(e))
+
+    if reqs is not None and not reqs:
         st.info("No requests found.")
-    else:
-        df = pd.DataFrame(reqs)
-        df["Status Badge"] = df["status"].apply(status_badge)
-        df["Created"] = pd.to_datetime(df["created_at"]).dt.strftime("%Y-%m-%d %H:%M")
+    elif reqs:
+        df = requests_table(reqs)
         st.dataframe(
-            df[["id", "school_name", "nurse_name", "Status Badge", "Created"]],
+            df[["id", "school_name", "nurse_name", "Status", "Created"]],
             use_container_width=True,
             hide_index=True,
         )
@@ -102,10 +123,15 @@ with tab1:
             st.write(f"**Nurse:** {req_row['nurse_name']}")
             st.write(f"**Status:** {status_badge(req_row['status'])}")
 
-            lines = fetch_request_lines(sb, int(selected_id))
-            if not lines:
+            try:
+                lines = fetch_request_lines(sb, int(selected_id))
+            except DbError as e:
+                lines = None
+                st.error(describe_error(e))
+
+            if lines is not None and not lines:
                 st.warning("No request lines found.")
-            else:
+            elif lines:
                 lines_df = pd.DataFrame(lines)
 
                 st.markdown("#### Requested Items")
@@ -134,22 +160,30 @@ with tab1:
                     approved_map[line_id] = int(new_val)
 
                 c1, c2, c3 = st.columns(3)
+                received = req_row["status"] == "Approved & Received"
 
                 with c1:
-                    if st.button("Approve Request", type="primary", use_container_width=True):
-                        ok = update_approved_quantities(sb, int(selected_id), approved_map)
-                        if ok:
-                            st.success("✅ Approved successfully (Approved - Not Received).")
-                        else:
-                            st.error("Approval failed. Check DB tables.")
+                    if received:
+                        st.info("Received requests can no longer be amended.")
+                    elif st.button("Approve Request", type="primary", use_container_width=True):
+                        try:
+                            if update_approved_quantities(sb, int(selected_id), approved_map):
+                                st.success("✅ Approved successfully (Approved - Not Received).")
+                            else:
+                                st.warning("This request was already received; quantities were not changed.")
+                        except DbError as e:
+                            st.error(f"Approval failed. {describe_error(e)}")
 
                 with c2:
                     if st.button("Mark as Received (Deduct Stock)", use_container_width=True):
-                        ok = mark_request_received(sb, int(selected_id))
-                        if ok:
-                            st.success("✅ Marked as received and stock deducted.")
-                        else:
-                            st.error("Failed. Make sure approved quantities exist and inventory table is ready.")
+                        try:
+                            result = mark_request_received(sb, int(selected_id))
+                            if result == RECEIVED:
+                                st.success("✅ Marked as received and stock deducted.")
+                            else:
+                                st.success("✅ Request is marked as received (stock was already deducted; nothing deducted again).")
+                        except DbError as e:
+                            st.error(f"Failed. {describe_error(e)}")
 
                 with c3:
                     # PDF download available once approved (even if not received)
@@ -169,39 +203,57 @@ with tab1:
 with tab2:
     st.subheader("Receive Stock from Main Store (Add to Inventory)")
 
-    category = st.selectbox("Category", ["Medicine", "Consumables", "Stationery"], index=0, key="recv_cat")
-    items = fetch_items_with_stock(sb, category=category)
+    category = st.selectbox("Category", CATEGORIES, index=0, key="recv_cat")
+    try:
+        items = fetch_items_with_stock(sb, store_id, category=category)
+    except DbError as e:
+        items = None
+        st.error(describe_error(e))
 
-    if not items:
+    if items is not None and not items:
         st.info("No items found. Add items to the items table first.")
-    else:
-        df = pd.DataFrame(items)
-        item_map = {f"{r['name']} (Current: {int(r['qty'])} {r['unit']})": int(r["id"]) for _, r in df.iterrows()}
+    elif items:
+        item_map = option_labels(stock_table(items), "Current")
 
         item_label = st.selectbox("Select item", list(item_map.keys()))
         add_qty = st.number_input("Quantity received", min_value=1, step=1, value=1)
 
-        if st.button("Add to Inventory", type="primary", use_container_width=True):
-            ok = upsert_inventory_add(sb, item_map[item_label], int(add_qty))
-            if ok:
-                st.success("✅ Inventory updated.")
-            else:
-                st.error("Update failed. Check DB tables / permissions.")
+        # Medicines are tracked per lot so they can be issued first-expired-first-out.
+        lot_number, expiry_date = "", None
+        if category == "Medicine":
+            l1, l2 = st.columns(2)
+            with l1:
+                lot_number = st.text_input("Lot / batch number")
+            with l2:
+                expiry_date = st.date_input("Expiry date", min_value=date.today())
+
+        if st.button("Add to Inventory", type="primary", use_container_width=True, disabled=(category == "Medicine" and not lot_number.strip())):
+            try:
+                if category == "Medicine":
+                    ok = receive_lot(sb, store_id, item_map[item_label], lot_number, expiry_date, int(add_qty))
+                else:
+                    ok = upsert_inventory_add(sb, store_id, item_map[item_label], int(add_qty))
+                if ok:
+                    st.success("✅ Inventory updated.")
+                else:
+                    st.error("Update failed. Check the quantity and lot number.")
+            except DbError as e:
+                st.error(f"Update failed. {describe_write_error(e)}")
 
 
 with tab3:
-    st.subheader("Inventory Overview (All Categories)")
+    st.subheader(f"Inventory Overview (All Categories) — {store_name}")
 
-    all_rows = []
-    for cat in ["Medicine", "Consumables", "Stationery"]:
-        all_rows.extend(fetch_items_with_stock(sb, category=cat))
+    try:
+        all_rows = fetch_items_with_stock(sb, store_id)
+    except DbError as e:
+        all_rows = None
+        st.error(describe_error(e))
 
-    if not all_rows:
+    if all_rows is not None and not all_rows:
         st.info("No inventory data available yet.")
-    else:
-        df = pd.DataFrame(all_rows)
-        df["Stock Status"] = df["qty"].apply(lambda x: "Out of stock" if int(x) <= 0 else ("🔴 < 50" if int(x) < 50 else ("🟠 50–200" if int(x) <= 200 else "🟢 > 200")))
-        df = df.sort_values(["category", "name"])
+    elif all_rows:
+        df = stock_table(all_rows).sort_values(["category", "name"])
 
         st.dataframe(
             df[["category", "name", "unit", "qty", "Stock Status"]],
@@ -210,3 +262,85 @@ with tab3:
         )
 
         st.caption("Color thresholds: < 50 red, 50–200 orange, > 200 green. (0 shows Out of stock.)")
+
+
+with tab4:
+    st.subheader("Expiring Medicine Lots")
+
+    within_days = st.number_input("Expiring within (days)", min_value=0, step=1, value=EXPIRY_WARNING_DAYS)
+    try:
+        lots = fetch_expiring_lots(sb, store_id, int(within_days))
+    except DbError as e:
+        lots = None
+        st.error(describe_error(e))
+
+    if lots is not None and not lots:
+        st.info("No lots with stock expire in this window.")
+    elif lots:
+        df = pd.DataFrame(lots)
+        df["Expiry"] = expiry_labels(df["days_left"])
+
+        st.dataframe(
+            df[["category", "item_name", "lot_number", "expiry_date", "Expiry", "qty", "unit"]],
+            use_container_width=True,
+            hide_index=True,
+        )
+
+        st.caption("Expired lots are never issued or counted as available; requests are filled from the first-expiring valid lot.")
+
+
+with tab5:
+    st.subheader("Transfer Stock to Another Store")
+
+    try:
+        other_stores = [r for r in fetch_stores(sb) if int(r["id"]) != int(store_id)]
+        items = fetch_items_with_stock(sb, store_id)
+    except DbError as e:
+        other_stores, items = None, None
+        st.error(describe_error(e))
+
+    if other_stores is not None and not other_stores:
+        st.info("No other stores found. Add stores to the stores table first.")
+    elif other_stores:
+        df = stock_table(items)
+        in_stock = df[df["qty"] > 0]
+        if in_stock.empty:
+            st.info("This store has no stock to transfer.")
+        else:
+            to_store = st.selectbox("To store", other_stores, format_func=lambda r: r["name"], key="xfer_to")
+            item_map = option_labels(in_stock, "Current")
+            item_label = st.selectbox("Item", list(item_map.keys()), key="xfer_item")
+            item = in_stock.set_index("id").loc[item_map[item_label]]
+            xfer_qty = st.number_input("Quantity to transfer", min_value=1, max_value=int(item["qty"]), step=1, value=1, key="xfer_qty")
+
+            if st.button("Transfer", type="primary", use_container_width=True):
+                try:
+                    ok = transfer_stock(sb, store_id, to_store["id"], item_map[item_label], int(xfer_qty))
+                    if ok:
+                        st.success(f"✅ Transferred {int(xfer_qty)} {item['unit']} of {item['name']} to {to_store['name']}.")
+                    else:
+                        st.error("Transfer failed. This store no longer holds enough stock.")
+                except DbError as e:
+                    st.error(f"Transfer failed. {describe_write_error(e)}")
+
+    st.divider()
+    st.subheader(f"Schools Served by {store_name}")
+
+    new_school = st.text_input("Assign school to this store", key="assign_school")
+    if st.button("Assign School", use_container_width=True, disabled=not new_school.strip()):
+        try:
+            assign_school_to_store(sb, new_school, store_id)
+            st.success(f"✅ {new_school.strip()} is now served by {store_name}.")
+        except DbError as e:
+            st.error(f"Assignment failed. {describe_error(e)}")
+
+    try:
+        schools = fetch_schools_for_store(sb, store_id)
+    except DbError as e:
+        schools = None
+        st.error(describe_error(e))
+
+    if schools is not None and not schools:
+        st.info("No schools assigned to this store yet.")
+    elif schools:
+        st.dataframe(pd.DataFrame({"School": schools}), use_container_width=True, hide_index=True)
@@ -0,0 +1,109 @@
+"""
+Micro-benchmark: per-rerun CPU time of the stock/request table rendering.
+
+Compares the previous row-wise page code (per-row .apply badges,
+iterrows() option labels, dt.strftime) with the columnar pipeline in
+app/ui.py, on synthetic catalogs of increasing size.
+
+    python tools/bench_render.py
+    python tools/bench_render.py --rows 1000 10000 50000 --repeat 5
+"""
+import argparse
+import bisect
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd  # noqa: E402
+
+from app.constants import CATEGORIES, STATUS_LABELS, STOCK_LEVELS, STOCK_RED_MAX, STOCK_ORANGE_MAX  # noqa: E402
+from app.ui import stock_table, option_labels, requests_table  # noqa: E402
+
+
+def make_rows(n: int):
+    rng = random.Random(42)
+    items = [
+        {
+            "id": i,
+            "name": f"Item {i:06d}",
+            "category": rng.choice(CATEGORIES),
+            "unit": rng.choice(["box", "pcs", "bottle", ""]),
+            "qty": rng.choice([0, rng.randint(1, 49), rng.randint(50, 200), rng.randint(201, 5000)]),
+        }
+        for i in range(1, n + 1)
+    ]
+    statuses = list(STATUS_LABELS)
+    reqs = [
+        {
+            "id": i,
+            "school_name": f"School {i % 300}",
+            "nurse_name": f"Nurse {i % 900}",
+            "status": rng.choice(statuses),
+            "created_at": f"2026-0{rng.randint(1, 9)}-1{rng.randint(0, 9)}T08:30:00+00:00",
+            "updated_at": f"2026-0{rng.randint(1, 9)}-1{rng.randint(0, 9)}T09:45:00+00:00",
+        }
+        for i in range(1, n + 1)
+    ]
+    return items, reqs
+
+
+def render_rowwise(items, reqs):
+    # The old pages' per-row Python calls, replayed with the shared thresholds.
+    edges = [0, STOCK_RED_MAX, STOCK_ORANGE_MAX]
+    df = pd.DataFrame(items)
+    df["Stock Status"] = df["qty"].apply(lambda q: STOCK_LEVELS[bisect.bisect_left(edges, int(q))])
+    available = df[df["qty"] > 0].copy()
+    labels = {f"{r['name']} (Available: {int(r['qty'])} {r['unit']})": int(r["id"]) for _, r in available.iterrows()}
+
+    rdf = pd.DataFrame(reqs)
+    rdf["Status"] = rdf["status"].apply(lambda v: STATUS_LABELS.get(v, v))
+    rdf["Created"] = pd.to_datetime(rdf["created_at"]).dt.strftime("%Y-%m-%d %H:%M")
+    rdf["Updated"] = pd.to_datetime(rdf["updated_at"]).dt.strftime("%Y-%m-%d %H:%M")
+    return df, labels, rdf
+
+
+def render_columnar(items, reqs):
+    df = stock_table(items)
+    labels = option_labels(df[df["qty"] > 0], "Available")
+    rdf = requests_table(reqs)
+    return df, labels, rdf
+
+
+def best_cpu_ms(fn, *args, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.process_time()
+        fn(*args)
+        best = min(best, time.process_time() - t0)
+    return best * 1000
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rows", type=int, nargs="+", default=[1_000, 10_000, 50_000])
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    print(f"{'rows':>8}  {'row-wise ms':>12}  {'columnar ms':>12}  {'saved ms':>10}  {'speedup':>8}")
+    for n in args.rows:
+        items, reqs = make_rows(n)
+
+        # Same output, so the comparison is like for like.
+        old_df, old_labels, old_rdf = render_rowwise(items, reqs)
+        new_df, new_labels, new_rdf = render_columnar(items, reqs)
+        assert old_labels == new_labels
+        assert (old_df["Stock Status"] == new_df["Stock Status"].astype(str)).all()
+        assert (old_rdf["Status"] == new_rdf["Status"].astype(str)).all()
+        assert (old_rdf["Created"] == new_rdf["Created"]).all()
+
+        old_ms = best_cpu_ms(render_rowwise, items, reqs, repeat=args.repeat)
+        new_ms = best_cpu_ms(render_columnar, items, reqs, repeat=args.repeat)
+        print(f"{n:>8}  {old_ms:>12.1f}  {new_ms:>12.1f}  {old_ms - new_ms:>10.1f}  {old_ms / new_ms:>7.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,245 @@
+"""
+Local fault-injecting stand-in for Supabase's REST endpoint.
+
+Serves PostgREST-shaped responses: `/rest/v1/<table>` returns a few canned
+rows (filters are ignored), and `/rest/v1/rpc/<fn>` answers like the SQL
+functions in app/db.py (`create_requests` returns {client_ref, request_id}
+rows, `receive_request_fefo` returns "RECEIVED", `receive_lot` and
+`transfer_stock` return true, unknown functions a PGRST202 404). It randomly
+injects 503s (plain-text gateway errors and PostgREST JSON errors carrying a
+transient SQLSTATE), slow replies and dropped connections, so the retry /
+circuit-breaker behaviour in app/transport.py can be checked without a real
+project.
+
+Run the app against it:
+    python tools/fault_server.py --port 8787 --fail-rate 0.3 --delay-ms 200
+    # .streamlit/secrets.toml: SUPABASE_URL = "http://127.0.0.1:8787"
+
+Or run the built-in check (needs supabase-py), which builds the client the
+way the app does and calls the app's own helpers:
+    python tools/fault_server.py --selfcheck --fail-rate 0.3
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import socket
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+# Canned table rows; enough for fetch_items_with_stock to make both of its calls.
+TABLES = {
+    "stores": [{"id": 1, "name": "Main Store"}],
+    "items": [{"id": 1, "name": "Paracetamol 500mg", "category": "Medicine", "unit": "box", "active": True}],
+    "inventory_available": [{"item_id": 1, "qty": 120}],
+}
+
+
+class FaultConfig:
+    def __init__(self, fail_rate: float = 0.0, drop_rate: float = 0.0, delay_ms: int = 0, outage: bool = False):
+        self.fail_rate = fail_rate
+        self.drop_rate = drop_rate
+        self.delay_ms = delay_ms
+        self.outage = outage
+
+
+class FakeDatabase:
+    """
+    Just enough state for the RPCs to answer like the real functions.
+    """
+
+    def __init__(self):
+        self._ids = itertools.count(1)
+        self._requests = {}
+        self._lock = threading.Lock()
+
+    def rpc(self, fn: str, params: dict):
+        if fn == "create_requests":
+            rows = []
+            with self._lock:
+                for r in params.get("p_requests") or []:
+                    # Retried client_refs get their original id back, like `on conflict do nothing`.
+                    request_id = self._requests.setdefault(r["client_ref"], next(self._ids))
+                    rows.append({"client_ref": r["client_ref"], "request_id": request_id})
+            return 200, rows
+        if fn == "receive_request_fefo":
+            return 200, "RECEIVED"
+        if fn in ("receive_lot", "transfer_stock"):
+            return 200, True
+        return 404, {
+            "code": "PGRST202",
+            "message": f"Could not find the function public.{fn} in the schema cache",
+            "details": None,
+            "hint": None,
+        }
+
+
+def make_handler(cfg: FaultConfig, db: FakeDatabase):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        wbufsize = 1 << 16  # send headers and body in one segment (avoids Nagle/delayed-ACK stalls)
+
+        def log_message(self, fmt, *args):
+            pass
+
+        def _reply(self, status: int, body: bytes, content_type: str = "application/json"):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _reply_json(self, status: int, obj):
+            self._reply(status, json.dumps(obj).encode())
+
+        def _handle(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b""
+
+            if cfg.delay_ms:
+                time.sleep(random.uniform(0, cfg.delay_ms) / 1000.0)
+
+            roll = random.random()
+            if cfg.outage or roll < cfg.fail_rate:
+                if random.random() < 0.5:
+                    # Gateway error: not JSON, so postgrest reports the HTTP status as the code.
+                    self._reply(503, b"Service Unavailable", "text/plain")
+                else:
+                    # PostgREST error with a transient SQLSTATE (class 57: operator intervention).
+                    self._reply_json(503, {"code": "57P03", "message": "the database system is starting up", "details": None, "hint": None})
+                return
+            if roll < cfg.fail_rate + cfg.drop_rate:
+                self.close_connection = True
+                self.connection.shutdown(socket.SHUT_RDWR)
+                return
+
+            path = urlsplit(self.path).path
+            if path.startswith("/rest/v1/rpc/"):
+                status, body = db.rpc(path.rsplit("/", 1)[-1], json.loads(raw or b"{}"))
+                self._reply_json(status, body)
+            elif self.command == "GET":
+                self._reply_json(200, TABLES.get(path.rsplit("/", 1)[-1], []))
+            else:
+                self._reply_json(200, [])
+
+        do_GET = do_POST = do_PATCH = do_DELETE = _handle
+
+    return Handler
+
+
+def serve(port: int, cfg: FaultConfig) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(cfg, FakeDatabase()))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def selfcheck(port: int, cfg: FaultConfig, calls: int) -> int:
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from app.db import (
+        RECEIVED,
+        create_requests_batch,
+        create_supabase_client,
+        fetch_items_with_stock,
+        mark_request_received,
+    )
+    from app.transport import DbError, TransientDbError, CircuitOpenError, execute
+
+    # Same construction as get_supabase(): shared pooled httpx client via ClientOptions.
+    sb = create_supabase_client(f"http://127.0.0.1:{port}", "selfcheck.anon.key")
+    if sb is None:
+        print("supabase-py is not installed.")
+        return 1
+
+    def read_stock():
+        items = fetch_items_with_stock(sb, 1)
+        assert items and items[0]["qty"] == 120, items
+
+    def submit():
+        ref = uuid.uuid4().hex
+        sub = {"client_ref": ref, "store_id": 1, "school_name": "Selfcheck School", "nurse_name": "Selfcheck", "lines": [{"item_id": 1, "requested_qty": 1}]}
+        ids = create_requests_batch(sb, [sub])
+        assert ref in ids, ids
+
+    def receive():
+        assert mark_request_received(sb, 1) == RECEIVED
+
+    ok, failed, wrong, latencies = 0, 0, 0, []
+    for i in range(calls):
+        t0 = time.perf_counter()
+        try:
+            (read_stock, submit, receive)[i % 3]()
+            ok += 1
+        except DbError:
+            failed += 1
+        except AssertionError as e:
+            wrong += 1
+            print(f"unexpected reply: {e}")
+        latencies.append(time.perf_counter() - t0)
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+    print(f"fail_rate={cfg.fail_rate} drop_rate={cfg.drop_rate}: {ok}/{calls} ok, {failed} typed errors, {wrong} wrong replies, p50={p50:.1f}ms p99={p99:.1f}ms")
+
+    # A PostgREST error code (PGRST202) is permanent: DbError, not retried as transient.
+    saved, cfg.fail_rate, cfg.drop_rate = (cfg.fail_rate, cfg.drop_rate), 0.0, 0.0
+    try:
+        execute(sb.rpc("no_such_function", {}))
+        permanent = False
+    except TransientDbError:
+        permanent = False
+    except DbError:
+        permanent = True
+    cfg.fail_rate, cfg.drop_rate = saved
+    print(f"unknown function reported as permanent error: {permanent}")
+
+    # Full outage: the breaker must open and short-circuit without touching the network.
+    cfg.outage = True
+    opened = False
+    for _ in range(50):
+        try:
+            fetch_items_with_stock(sb, 1)
+        except CircuitOpenError:
+            opened = True
+            break
+        except DbError:
+            pass
+    cfg.outage = False
+    print(f"circuit opened during outage: {opened}")
+    return 0 if opened and permanent and not wrong else 1
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--port", type=int, default=8787)
+    ap.add_argument("--fail-rate", type=float, default=0.2, help="fraction of calls answered with 503")
+    ap.add_argument("--drop-rate", type=float, default=0.05, help="fraction of connections closed without a reply")
+    ap.add_argument("--delay-ms", type=int, default=0, help="random extra latency per reply, up to this value")
+    ap.add_argument("--selfcheck", action="store_true", help="run the app's helpers against the server and report")
+    ap.add_argument("--calls", type=int, default=200)
+    args = ap.parse_args()
+
+    cfg = FaultConfig(args.fail_rate, args.drop_rate, args.delay_ms)
+    server = serve(args.port, cfg)
+    if args.selfcheck:
+        try:
+            return selfcheck(args.port, cfg, args.calls)
+        finally:
+            server.shutdown()
+
+    print(f"Fault server on http://127.0.0.1:{args.port} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())